@@ -7,8 +7,11 @@ import tensorflow as tf
 import cv2
 import threading
 import time
+import profiling
+from profiling import span
 
 app = Flask(__name__)
+profiling.init_app(app)
 model = tf.keras.models.load_model("models/model_small.h5")
 
 # OpenCV Camera Setup
@@ -455,15 +458,17 @@ def capture_frame():
         
         # Save captured frame
         temp_name = f"uploadimages/temp_{uuid.uuid4().hex}_capture.jpg"
-        cv2.imwrite(temp_name, frame_to_save)
+        with span('save_capture'):
+            cv2.imwrite(temp_name, frame_to_save)
         
         # Predict
         prediction = model_predict(f'./{temp_name}')
         
-        return render_template('index.html',
-                             result=True,
-                             imagepath=f'/{temp_name}',
-                             prediction=prediction)
+        with span('render_template'):
+            return render_template('index.html',
+                                 result=True,
+                                 imagepath=f'/{temp_name}',
+                                 prediction=prediction)
     except Exception as e:
         print(f"Error capturing frame: {e}")
         return render_template('index.html', error=f"Capture failed: {str(e)}")
@@ -603,14 +608,17 @@ def home():
     return render_template('index.html')
 
 def extract_features(image):
-    image = tf.keras.utils.load_img(image,target_size=(160,160))
+    with span('load_img'):
+        image = tf.keras.utils.load_img(image,target_size=(160,160))
     feature = tf.keras.utils.img_to_array(image)
     feature = np.array([feature])
     return feature
 
 def model_predict(image):
-    img = extract_features(image)
-    prediction = model.predict(img)
+    with span('extract_features'):
+        img = extract_features(image)
+    with span('model.predict'):
+        prediction = model.predict(img)
     # print(prediction)
     prediction_label = plant_disease[prediction.argmax()]
     return prediction_label
@@ -620,10 +628,12 @@ def uploadimage():
     if request.method == "POST":
         image = request.files['img']
         temp_name = f"uploadimages/temp_{uuid.uuid4().hex}"
-        image.save(f'{temp_name}_{image.filename}')
+        with span('save_upload'):
+            image.save(f'{temp_name}_{image.filename}')
         print(f'{temp_name}_{image.filename}')
         prediction = model_predict(f'./{temp_name}_{image.filename}')
-        return render_template('index.html',result=True,imagepath = f'/{temp_name}_{image.filename}', prediction = prediction )
+        with span('render_template'):
+            return render_template('index.html',result=True,imagepath = f'/{temp_name}_{image.filename}', prediction = prediction )
     
     else:
         return redirect('/')
@@ -0,0 +1,229 @@
+"""Opt-in per-request profiling for the PlantAI Flask app.
+
+A request is profiled when it carries the ``X-Profile`` header or when it is
+picked by the ``PROFILE_SAMPLE_RATE`` sampler. Profiled requests record a tree
+of named spans (see ``span``) and, when they take longer than
+``PROFILE_SLOW_MS``, dump the span tree plus cProfile or TensorFlow profiler
+output into a bounded ring of trace files under ``PROFILE_DIR``.
+
+When a request is not profiled, ``span`` returns a shared no-op context
+manager, so the instrumentation left in the app costs a single lookup.
+"""
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+
+from flask import g, jsonify, request, send_from_directory
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 1000))
+PROFILE_MAX_TRACES = int(os.environ.get("PROFILE_MAX_TRACES", 20))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# "cprofile" or "tensorflow"
+PROFILE_BACKEND = os.environ.get("PROFILE_BACKEND", "cprofile")
+
+_current_trace = contextvars.ContextVar('profile_trace', default=None)
+_noop_span = contextlib.nullcontext()
+# cProfile and the TensorFlow profiler are both process-wide, so only one
+# request at a time gets a profiler attached; the others still record spans.
+_profiler_lock = threading.Lock()
+_ring_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+            'children': [child.to_dict(origin) for child in self.children]
+        }
+
+
+class Trace:
+    def __init__(self, name):
+        self.id = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        self.root = Span(name)
+        self.stack = [self.root]
+        self.profiler = None
+        self.tf_logdir = None
+
+    @contextlib.contextmanager
+    def span(self, name):
+        node = Span(name)
+        self.stack[-1].children.append(node)
+        self.stack.append(node)
+        try:
+            yield node
+        finally:
+            node.end = time.perf_counter()
+            self.stack.pop()
+
+
+def span(name):
+    """Time a stage of the current request; a no-op unless it is profiled."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _noop_span
+    return trace.span(name)
+
+
+def _should_profile():
+    if request.headers.get(PROFILE_HEADER):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _start_profiler(trace):
+    if not _profiler_lock.acquire(blocking=False):
+        return
+    try:
+        if PROFILE_BACKEND == "tensorflow":
+            import tensorflow as tf
+            trace.tf_logdir = os.path.join(PROFILE_DIR, f"tmp_{trace.id}")
+            tf.profiler.experimental.start(trace.tf_logdir)
+        else:
+            trace.profiler = cProfile.Profile()
+            trace.profiler.enable()
+    except Exception as e:
+        print(f"Could not start {PROFILE_BACKEND} profiler: {e}")
+        trace.profiler = None
+        trace.tf_logdir = None
+        _profiler_lock.release()
+
+
+def _stop_profiler(trace):
+    if trace.profiler is None and trace.tf_logdir is None:
+        return
+    try:
+        if trace.profiler is not None:
+            trace.profiler.disable()
+        else:
+            import tensorflow as tf
+            tf.profiler.experimental.stop()
+    except Exception as e:
+        print(f"Could not stop {PROFILE_BACKEND} profiler: {e}")
+    finally:
+        _profiler_lock.release()
+
+
+def _trace_files(trace_id):
+    return [name for name in os.listdir(PROFILE_DIR)
+            if name.startswith(trace_id) and not name.startswith("tmp_")]
+
+
+def _prune_traces():
+    """Keep only the newest PROFILE_MAX_TRACES traces on disk."""
+    trace_ids = sorted(name[:-len(".json")] for name in os.listdir(PROFILE_DIR)
+                       if name.endswith(".json"))
+    for trace_id in trace_ids[:max(len(trace_ids) - PROFILE_MAX_TRACES, 0)]:
+        for name in _trace_files(trace_id):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name))
+            except OSError as e:
+                print(f"Could not remove trace file {name}: {e}")
+
+
+def _save_trace(trace, duration_ms, status):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    files = []
+    if trace.profiler is not None:
+        trace.profiler.dump_stats(os.path.join(PROFILE_DIR, f"{trace.id}.prof"))
+        files.append(f"{trace.id}.prof")
+    elif trace.tf_logdir is not None:
+        shutil.make_archive(os.path.join(PROFILE_DIR, f"{trace.id}.tf"), 'zip', trace.tf_logdir)
+        files.append(f"{trace.id}.tf.zip")
+    record = {
+        'id': trace.id,
+        'method': request.method,
+        'path': request.path,
+        'status': status,
+        'duration_ms': round(duration_ms, 3),
+        'timestamp': time.time(),
+        'backend': PROFILE_BACKEND if files else None,
+        'files': [f"{trace.id}.json"] + files,
+        'spans': trace.root.to_dict(trace.root.start)
+    }
+    with open(os.path.join(PROFILE_DIR, f"{trace.id}.json"), 'w') as file:
+        json.dump(record, file, indent=2)
+    with _ring_lock:
+        _prune_traces()
+
+
+def _before_request():
+    if not _should_profile():
+        return
+    trace = Trace(f"{request.method} {request.path}")
+    g.profile_trace = trace
+    _current_trace.set(trace)
+    _start_profiler(trace)
+
+
+def _after_request(response):
+    if g.get('profile_trace') is not None:
+        g.profile_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    trace = g.pop('profile_trace', None)
+    if trace is None:
+        return
+    trace.root.end = time.perf_counter()
+    _stop_profiler(trace)
+    _current_trace.set(None)
+    duration_ms = (trace.root.end - trace.root.start) * 1000
+    status = g.pop('profile_status', 500)
+    try:
+        if duration_ms >= PROFILE_SLOW_MS:
+            _save_trace(trace, duration_ms, status)
+            print(f"Saved profile trace {trace.id} for {trace.root.name} ({duration_ms:.1f} ms)")
+    except Exception as e:
+        print(f"Error saving profile trace {trace.id}: {e}")
+    finally:
+        if trace.tf_logdir is not None:
+            shutil.rmtree(trace.tf_logdir, ignore_errors=True)
+
+
+def list_profiles():
+    """List saved slow-request traces, newest first"""
+    traces = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(PROFILE_DIR, name), 'r') as file:
+                    record = json.load(file)
+            except (OSError, ValueError):
+                continue
+            record.pop('spans', None)
+            traces.append(record)
+    return jsonify({'traces': traces, 'slow_ms': PROFILE_SLOW_MS, 'max_traces': PROFILE_MAX_TRACES})
+
+
+def download_profile(filename):
+    return send_from_directory(os.path.abspath(PROFILE_DIR), filename, as_attachment=True)
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/profiles', 'list_profiles', list_profiles, methods=['GET'])
+    app.add_url_rule('/profiles/<path:filename>', 'download_profile', download_profile, methods=['GET'])